@@ -1,12 +1,21 @@
 import os
 import re
+import sys
+import functools
+import collections
 import logging
 import yaml
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from docx import Document
+from docx.oxml.ns import qn
+from lxml.etree import XPath
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
 
 # 设置日志
 logging.basicConfig(
@@ -19,8 +28,54 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Word文档命名空间
+_W_NS = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+
+# 预编译XPath：段落中是否包含图片
+_HAS_IMG_XPATH = XPath('boolean(.//w:drawing | .//w:pict)', namespaces=_W_NS)
+
+# 预编译XPath：段落中的文本类元素（与Paragraph.text取值范围一致，不含域代码）
+_TEXT_XPATH = XPath('(w:r | w:hyperlink/w:r)/*[self::w:t or self::w:tab or self::w:br'
+                    ' or self::w:cr or self::w:noBreakHyphen or self::w:ptab]',
+                    namespaces=_W_NS)
+
+# 非w:t文本类元素对应的字符
+_W_T = qn('w:t')
+_W_BR_TYPE = qn('w:type')
+_RUN_CHARS = {
+    qn('w:tab'): '\t',
+    qn('w:ptab'): '\t',
+    qn('w:br'): '\n',
+    qn('w:cr'): '\n',
+    qn('w:noBreakHyphen'): '-'
+}
+
+def _paragraph_text(p):
+    """提取段落（<w:p>元素）文本，制表符、换行等转换为对应字符，与Paragraph.text一致"""
+    parts = []
+    for el in _TEXT_XPATH(p):
+        if el.tag == _W_T:
+            parts.append(el.text or '')
+        elif el.get(_W_BR_TYPE) in (None, 'textWrapping'):  # 分页符、分栏符不产生文本
+            parts.append(_RUN_CHARS[el.tag])
+    return ''.join(parts)
+
+def _safe_float(value):
+    """按float()语义解析数值，无法解析时返回None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+_SAFE_FLOAT = np.frompyfunc(_safe_float, 1, 1)
+
+# 题干中的空括号，统一为填空格式
+_PAREN_RE = re.compile(r'（\s*）')
+
 class QuestionConfig:
     """题目处理配置类"""
+    __slots__ = ('default_config', 'config')
+
     def __init__(self, config_path=None):
         # 默认配置
         self.default_config = {
@@ -55,118 +110,140 @@ class QuestionConfig:
                 logger.error(f"加载配置文件失败: {str(e)}")
                 logger.info("使用默认配置")
 
-    def get_tag_content(self, text, tag_type):
-        """从文本中提取标签内容"""
-        for tag in self.config['tags'][tag_type]:
-            if text.startswith(tag):
-                return text[len(tag):].strip()
-        return None
-
     def determine_difficulty(self, value):
         """确定难度等级"""
-        try:
-            value = float(value)
-            if value < self.config['difficulty_levels']['easy']['threshold']:
-                return self.config['difficulty_levels']['easy']['name']
-            elif value == self.config['difficulty_levels']['medium']['threshold']:
-                return self.config['difficulty_levels']['medium']['name']
-            else:
-                return self.config['difficulty_levels']['hard']['name']
-        except ValueError:
-            logger.warning(f"无法解析难度值: {value}")
-            return self.config['difficulty_levels']['medium']['name']
+        return self.determine_difficulty_batch([value])[0]
+
+    def determine_difficulty_batch(self, values):
+        """批量确定难度等级，None表示题目没有难度标签，结果保持为空"""
+        levels = self.config['difficulty_levels']
+        raw = np.array(values, dtype=object)
+        missing = np.equal(raw, None)
+
+        # 按float()语义逐个解析（支持全角数字、'nan'等），无法解析的为None
+        parsed = _SAFE_FLOAT(raw)
+        invalid = np.equal(parsed, None) & ~missing
+        if invalid.any():
+            logger.warning(f"无法解析难度值: {raw[invalid].tolist()}")
+        arr = np.where(invalid | missing, np.nan, parsed).astype(float)
+
+        names = np.where(arr < levels['easy']['threshold'], levels['easy']['name'],
+                         np.where(arr == levels['medium']['threshold'], levels['medium']['name'],
+                                  levels['hard']['name']))
+        names = np.where(invalid, levels['medium']['name'], names)
+        return np.where(missing, '', names).tolist()
 
 class QuestionType:
     """题目类型判断类"""
+    __slots__ = ('config', '_opt_count_re', '_opt_bits', '_judge_set', '_judge_upper', '_valid_options')
+
     def __init__(self, config):
         self.config = config
 
+        # 预编译选项计数正则：选项字母后接“.”、“．”或空格
+        opts = ''.join(map(re.escape, self.config.config['options']))
+        self._opt_count_re = re.compile(rf'([{opts}])[.． ]')
+        self._opt_bits = {opt: 1 << i for i, opt in enumerate(self.config.config['options'])}
+
+        # 题型判断用的集合，只构建一次；均为可哈希的frozenset，可作为缓存键的一部分
+        judge_answers = self.config.config['judge_answers']
+        self._judge_set = frozenset(judge_answers)
+        self._judge_upper = frozenset(ans.upper() for ans in judge_answers)
+        self._valid_options = frozenset(self.config.config['options'])
+
     def determine_type(self, answer):
         """判断题目类型"""
+        return self._classify(answer, self._judge_set, self._judge_upper, self._valid_options)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _classify(answer, judge_set, judge_upper, valid_options):
+        """根据答案判断题目类型，题库中答案种类很少，按答案字符串缓存结果"""
         if not answer:
-            logger.info("空答案")
             return '未知类型'
 
         original_answer = answer
         answer = answer.upper().strip()
-        logger.info(f"判断题目类型 - 原始答案: {original_answer}, 处理后: {answer}")
 
         # 判断题
-        judge_answers = self.config.config['judge_answers']
-        for judge_ans in judge_answers:
-            if judge_ans == original_answer or judge_ans.upper() == answer:
-                logger.info(f"识别为判断题")
-                return '判断题'
+        if original_answer in judge_set or answer in judge_upper:
+            return '判断题'
 
         # 选择题
-        valid_options = set(self.config.config['options'])
-        answer_chars = set(answer.replace(' ', ''))
+        compact = answer.replace(' ', '')
+        answer_chars = set(compact)
         if answer_chars and answer_chars.issubset(valid_options):
-            is_multi = len(answer.replace(' ', '')) > 1
-            logger.info(f"识别为{'多' if is_multi else '单'}选题")
+            is_multi = len(compact) > 1
             return '多选题' if is_multi else '单选题'
 
         # 填空题
-        logger.info(f"识别为填空题")
         return '填空题'
 
     def count_options(self, choices):
         """计算选项数量"""
         if not choices:
             return 0
-        options = self.config.config['options']
-        count = 0
-        choices = choices.upper()
-        for opt in options:
-            if f"{opt}." in choices or f"{opt}．" in choices or f"{opt} " in choices:
-                count += 1
-        return count
+        return bin(self.option_mask(choices)).count('1')
+
+    def option_mask(self, text):
+        """返回文本中出现的选项位掩码，用于逐段落累计选项"""
+        mask = 0
+        for opt in self._opt_count_re.findall(text.upper()):
+            mask |= self._opt_bits[opt]
+        return mask
 
 class QuestionProcessor:
     """题目处理类"""
+    __slots__ = ('config', 'question_type', 'stats', '_start_re', '_num_sub_re',
+                 '_tag_lookup', '_all_tag_prefixes', '_opt_prefixes')
+
     def __init__(self, config):
         self.config = config
         self.question_type = QuestionType(config)
-        self.stats = {
+        self.stats = collections.Counter({
             '单选题': 0,
             '多选题': 0,
             '判断题': 0,
             '填空题': 0,
             '未知类型': 0,
             '总题数': 0
-        }
+        })
+
+        # 预编译题号正则
+        seps = ''.join(map(re.escape, self.config.config['separators']))
+        self._start_re = re.compile(rf'^\d+[{seps}]')
+        self._num_sub_re = re.compile(rf'^\d+[{seps}]\s*')
+
+        # 标签前缀 -> 标签类型，按长度降序以优先匹配最长前缀
+        self._tag_lookup = {sys.intern(tag): tag_type
+                            for tag_type, tags in self.config.config['tags'].items()
+                            for tag in tags}
+        self._all_tag_prefixes = tuple(sorted(self._tag_lookup, key=len, reverse=True))
+
+        # 选项开头前缀，如 A. / A．
+        self._opt_prefixes = tuple(f"{opt}{sep}"
+                                   for opt in self.config.config['options']
+                                   for sep in ('.', '．'))
 
     def is_question_start(self, text):
-        """检查是否是题目开始"""
-        for sep in self.config.config['separators']:
-            pattern = r'^\d+' + sep
-            if re.match(pattern, text.strip()):
-                return True
-        return False
+        """检查是否是题目开始（text为已去除首尾空白的段落文本）"""
+        return bool(self._start_re.match(text))
 
     def is_option_start(self, text):
-        """检查是否是选项开始"""
-        text = text.strip()
-        return any(text.startswith(f"{opt}.") or text.startswith(f"{opt}．")
-                  for opt in self.config.config['options'])
+        """检查是否是选项开始（text为已去除首尾空白的段落文本）"""
+        return text.startswith(self._opt_prefixes)
 
-    def has_image(self, paragraph):
-        """检查段落是否包含图片"""
+    def has_image(self, p):
+        """检查段落（<w:p>元素）是否包含图片"""
         try:
-            for run in paragraph.runs:
-                if run._element.findall('.//w:drawing', run._element.nsmap) or \
-                   run._element.findall('.//w:pict', run._element.nsmap):
-                    return True
+            return bool(_HAS_IMG_XPATH(p))
         except Exception as e:
             logger.warning(f"检查图片时出错: {str(e)}")
         return False
 
     def remove_question_number(self, text):
         """移除题目编号"""
-        for sep in self.config.config['separators']:
-            pattern = r'^\d+' + sep + r'\s*'
-            text = re.sub(pattern, '', text)
-        return text
+        return self._num_sub_re.sub('', text)
 
     def process_document(self, doc_path):
         """处理文档"""
@@ -192,14 +269,15 @@ class QuestionProcessor:
         collecting_title = False
         current_title_lines = []
         current_choices = []
+        current_opt_mask = 0
         current_has_image = False
 
         def save_current_question():
-            nonlocal current_question, current_title_lines, current_choices, current_has_image
+            nonlocal current_question, current_title_lines, current_choices, current_opt_mask, current_has_image
             if current_question:
                 # 保存题干
                 full_title = ' '.join(current_title_lines)
-                cleaned_title = re.sub(r'（\s*）', '（   ）', full_title)
+                cleaned_title = _PAREN_RE.sub('（   ）', full_title)
                 cleaned_title = self.remove_question_number(cleaned_title)
                 data['title_list'].append(cleaned_title)
                 data['has_image_list'].append(current_has_image)
@@ -207,27 +285,37 @@ class QuestionProcessor:
                 # 保存选项
                 choice_text = '\n'.join(current_choices) if current_choices else ''
                 data['choice_list'].append(choice_text)
-                data['option_count_list'].append(self.question_type.count_options(choice_text))
+                data['option_count_list'].append(bin(current_opt_mask).count('1'))
 
                 # 保存答案和题型
                 answer = current_question.get('answer', '')
                 data['answer_list'].append(answer)
                 question_type = self.question_type.determine_type(answer)
                 data['type_list'].append(question_type)
-                self.stats[question_type] = self.stats.get(question_type, 0) + 1
+                self.stats[question_type] += 1
 
                 # 保存其他信息
-                data['difficulty_list'].append(current_question.get('difficulty', ''))
+                data['difficulty_list'].append(current_question.get('difficulty'))  # 原始难度值，最后批量分级
                 data['knowledge_list'].append(current_question.get('knowledge', ''))
                 data['explain_list'].append(current_question.get('explanation', ''))
 
                 # 重置当前题目信息
                 current_title_lines.clear()
                 current_choices.clear()
+                current_opt_mask = 0
                 current_has_image = False
 
-        for para in doc.paragraphs:
-            text = para.text.strip()
+        # 逐段落日志只在DEBUG级别输出，循环外判断一次
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+        # 热循环中频繁访问的属性绑定为局部变量
+        tag_prefixes = self._all_tag_prefixes
+        tag_lookup = self._tag_lookup
+        option_mask = self.question_type.option_mask
+
+        # 直接遍历正文中的<w:p>元素，避免构建Paragraph包装对象
+        for p in doc.element.body.iterchildren(qn('w:p')):
+            text = _paragraph_text(p).strip()
             if not text:
                 continue
 
@@ -237,86 +325,70 @@ class QuestionProcessor:
                 current_question = {'title': text}
                 collecting_title = True
                 current_title_lines = [text]
-                current_has_image = self.has_image(para)
-                logger.info(f"发现新题目: {text}")
+                current_has_image = self.has_image(p)
+                if debug_enabled:
+                    logger.debug("发现新题目: %s", text)
 
             # 处理选项
             elif self.is_option_start(text):
                 collecting_title = False
                 current_choices.append(text)
+                current_opt_mask |= option_mask(text)
 
-            # 处理答案
-            elif any(text.startswith(tag) for tag in self.config.config['tags']['answer']):
-                answer_text = self.config.get_tag_content(text, 'answer')
-                if answer_text and current_question:
-                    current_question['answer'] = answer_text
-                    logger.info(f"处理答案: {answer_text}")
-
-            # 处理其他标签
-            elif any(text.startswith(tag) for tag in self.config.config['tags']['difficulty']):
-                difficulty_text = self.config.get_tag_content(text, 'difficulty')
+            # 处理标签（答案、难度、知识点、详解）
+            elif text.startswith(tag_prefixes):
+                tag = next(t for t in tag_prefixes if text.startswith(t))
+                tag_type = tag_lookup[tag]
+                content = text[len(tag):].strip()
                 if current_question:
-                    current_question['difficulty'] = self.config.determine_difficulty(difficulty_text)
-
-            elif any(text.startswith(tag) for tag in self.config.config['tags']['knowledge']):
-                knowledge_text = self.config.get_tag_content(text, 'knowledge')
-                if current_question:
-                    current_question['knowledge'] = knowledge_text
-
-            elif any(text.startswith(tag) for tag in self.config.config['tags']['explanation']):
-                explain_text = self.config.get_tag_content(text, 'explanation')
-                if current_question:
-                    current_question['explanation'] = explain_text
+                    if tag_type == 'answer':
+                        if content:
+                            current_question['answer'] = content
+                            if debug_enabled:
+                                logger.debug("处理答案: %s", content)
+                    else:
+                        current_question[tag_type] = content
 
             # 如果正在收集题干
             elif collecting_title:
                 current_title_lines.append(text)
                 if not current_has_image:
-                    current_has_image = self.has_image(para)
+                    current_has_image = self.has_image(p)
 
         # 保存最后一个题目
         save_current_question()
 
+        data['difficulty_list'] = self.config.determine_difficulty_batch(data['difficulty_list'])
         self.stats['总题数'] = len(data['title_list'])
         return data
 
 
 class QuestionExporter:
     """题目导出类"""
+    __slots__ = ('config',)
 
     def __init__(self, config):
         self.config = config
 
     def prepare_excel_data(self, data):
         """准备Excel数据"""
-        excel_data = []
-        for i in range(len(data['title_list'])):
-            # 处理题干和图片标记
-            title_text = data['title_list'][i]
-            has_image = data['has_image_list'][i] if i < len(data['has_image_list']) else False
-
-            # 处理选项
-            options_text = data['choice_list'][i] if i < len(data['choice_list']) else ''
-            option_count = data['option_count_list'][i] if i < len(data['option_count_list']) else 0
-
-            # 创建题目数据字典
-            question_data = {
-                '题型': data['type_list'][i] if i < len(data['type_list']) else '',
-                '题干': title_text,
-                '选项': options_text,
-                '选项数量': option_count,
-                '答案': data['answer_list'][i] if i < len(data['answer_list']) else '',
-                '解析': data['explain_list'][i] if i < len(data['explain_list']) else '',
-                '所属知识点': data['knowledge_list'][i] if i < len(data['knowledge_list']) else '',
-                '难度': data['difficulty_list'][i] if i < len(data['difficulty_list']) else '',
-                'has_image': has_image
-            }
-            excel_data.append(question_data)
-
-        return excel_data
+        # 各列表在处理文档时按题目同步追加，长度一致，可直接构建DataFrame
+        return pd.DataFrame({
+            '题型': data['type_list'],
+            '题干': data['title_list'],
+            '选项': data['choice_list'],
+            '选项数量': data['option_count_list'],
+            '答案': data['answer_list'],
+            '解析': data['explain_list'],
+            '所属知识点': data['knowledge_list'],
+            '难度': data['difficulty_list'],
+            'has_image': data['has_image_list']
+        })
+
+    def _write_excel_worksheet(self, worksheet, df):
+        """写入Excel工作表并设置格式"""
+        columns = self.config.config['output']['columns']
 
-    def _format_excel_worksheet(self, worksheet, data):
-        """设置Excel工作表格式"""
         # 设置列宽
         custom_widths = {
             '题型': 12,
@@ -328,58 +400,60 @@ class QuestionExporter:
             '所属知识点': 30,
             '难度': 10
         }
+        for idx, column_name in enumerate(columns, start=1):
+            worksheet.column_dimensions[get_column_letter(idx)].width = custom_widths.get(column_name, 20)
 
-        # 设置浅蓝色填充
+        # 共享样式对象
+        alignment = Alignment(wrap_text=True, vertical='center', horizontal='left')
+        header_font = Font(bold=True)
         light_blue_fill = PatternFill(start_color='E6F3FF', end_color='E6F3FF', fill_type='solid')
 
-        # 设置列宽
-        for idx, column in enumerate(worksheet.columns):
-            column_letter = column[0].column_letter
-            column_name = self.config.config['output']['columns'][idx]
-            worksheet.column_dimensions[column_letter].width = custom_widths.get(column_name, 20)
-
-        # 设置单元格格式
-        for row_idx, row in enumerate(worksheet.rows):
-            for cell in row:
-                cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='left')
-
-                if row_idx == 0:  # 表头行
-                    cell.font = Font(bold=True)
-                elif row_idx <= len(data):  # 数据行
-                    if data[row_idx - 1].get('has_image'):  # 检查是否包含图片
-                        cell.fill = light_blue_fill
+        # 表头行
+        header = []
+        for column_name in columns:
+            cell = WriteOnlyCell(worksheet, value=column_name)
+            cell.alignment = alignment
+            cell.font = header_font
+            header.append(cell)
+        worksheet.append(header)
+
+        # 数据行：按列顺序取值，不为每行构建字典
+        values = df.reindex(columns=columns, fill_value='').itertuples(index=False, name=None)
+        for has_image, row_values in zip(df['has_image'], values):
+            row = []
+            for value in row_values:
+                cell = WriteOnlyCell(worksheet, value=value)
+                cell.alignment = alignment
+                if has_image:
+                    cell.fill = light_blue_fill
+                row.append(cell)
+            worksheet.append(row)
 
     def export_to_excel(self, data, output_path=None):
         """导出到Excel"""
         try:
-            excel_data = self.prepare_excel_data(data)
+            df = self.prepare_excel_data(data)
 
-            # 按题型分组
-            grouped_data = []
+            # 按题型排序（稳定排序保持原题目顺序），未列出的题型不导出
             type_order = ['单选题', '多选题', '判断题', '填空题', '未知类型']
+            df['题型'] = pd.Categorical(df['题型'], categories=type_order, ordered=True)
+            df = df.dropna(subset=['题型']).sort_values('题型', kind='stable').reset_index(drop=True)
 
-            for question_type in type_order:
-                type_questions = [q for q in excel_data if q['题型'] == question_type]
-                if type_questions:
-                    if grouped_data:  # 在不同题型之间添加空行
-                        empty_row = {key: '' for key in self.config.config['output']['columns']}
-                        empty_row['has_image'] = False
-                        grouped_data.append(empty_row)
-                    grouped_data.extend(type_questions)
-
-            # 创建DataFrame时排除has_image列
-            columns = self.config.config['output']['columns']
-            df = pd.DataFrame(grouped_data)[columns]
+            # 在不同题型之间添加空行：在除第一组外每组的起始位置一次性插入
+            group_starts = np.flatnonzero(df['题型'].ne(df['题型'].shift()).to_numpy())[1:]
+            empty_row = [False if column == 'has_image' else '' for column in df.columns]
+            values = np.insert(df.astype(object).to_numpy(), group_starts, empty_row, axis=0)
+            grouped_data = pd.DataFrame(values, columns=df.columns)
 
             if output_path is None:
                 current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
                 output_path = f'题库导出_{current_time}.xlsx'
 
-            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='题库')
-                workbook = writer.book
-                worksheet = writer.sheets['题库']
-                self._format_excel_worksheet(worksheet, grouped_data)
+            # 使用只写模式流式写入，避免构建完整的单元格对象图
+            workbook = Workbook(write_only=True)
+            worksheet = workbook.create_sheet('题库')
+            self._write_excel_worksheet(worksheet, grouped_data)
+            workbook.save(output_path)
 
             logger.info(f"Excel文件已生成: {output_path}")
             return output_path
@@ -388,6 +462,14 @@ class QuestionExporter:
             logger.error(f"导出Excel时出错: {str(e)}")
             raise
 
+def _process_document_worker(config_dict, doc_path):
+    """子进程中处理单个文档，返回题目数据和题型统计"""
+    config = QuestionConfig()
+    config.config = config_dict
+    processor = QuestionProcessor(config)
+    data = processor.process_document(doc_path)
+    return data, processor.stats
+
 class QuestionBank:
     """题库管理主类"""
     def __init__(self, config_path=None):
@@ -407,6 +489,29 @@ class QuestionBank:
             logger.error(f"处理文件时出错: {str(e)}")
             raise
 
+    def process_files(self, file_paths, output_path=None, workers=None):
+        """多进程并行处理多个文件，合并后导出到同一个Excel"""
+        try:
+            logger.info(f"开始处理{len(file_paths)}个文件")
+            merged = collections.defaultdict(list)
+            # 只把配置字典传给子进程，结果按输入顺序合并
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                results = executor.map(_process_document_worker,
+                                       [self.config.config] * len(file_paths), file_paths)
+                for data, stats in results:
+                    for key, values in data.items():
+                        merged[key].extend(values)
+                    self.processor.stats.update(stats)
+
+            self.processor.stats['总题数'] = len(merged['title_list'])
+
+            output_file = self.exporter.export_to_excel(merged, output_path)
+            self._print_statistics()
+            return output_file
+        except Exception as e:
+            logger.error(f"处理文件时出错: {str(e)}")
+            raise
+
     def _print_statistics(self):
         """打印统计信息"""
         logger.info("\n=== 题目统计信息 ===")